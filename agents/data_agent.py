@@ -2,11 +2,21 @@ import logging
 import requests
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from app import db
-from models import Incident
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from agents.notification_agent import NotificationAgent
 
+# OpenWeatherMap "main" condition groups that warrant an alert
+SEVERE_CONDITIONS = frozenset({'thunderstorm', 'snow', 'rain', 'drizzle', 'mist', 'fog'})
+
+# Keys of the current-weather response kept in Incident.raw_data
+WEATHER_RAW_KEYS = ('id', 'coord', 'main', 'weather')
+
+# Search terms for local incidents and emergencies
+NEWS_KEYWORDS = ('accident', 'emergency', 'police', 'fire', 'traffic', 'closure', 'incident', 'alert', 'warning')
+
 class DataAgent:
     def __init__(self):
         self.weather_api_key = os.environ.get("OPENWEATHERMAP_API_KEY", "default_weather_key")
@@ -14,16 +24,30 @@ class DataAgent:
         self.default_location = os.environ.get("DEFAULT_LOCATION", "New York")
         self.notification_agent = None
         
+        # Shared session so connections to the weather/news APIs are kept alive between calls
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, backoff_factor=0.3)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
     def fetch_all_data(self):
         """Fetch data from all sources and trigger notification processing"""
         logging.info("Data Agent: Starting data fetch cycle")
         
         try:
-            weather_incidents = self.fetch_weather_data()
-            news_incidents = self.fetch_news_data()
+            # Weather and news sources are independent, so fetch them concurrently
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix='data-agent') as executor:
+                weather_future = executor.submit(self.fetch_weather_data)
+                news_future = executor.submit(self.fetch_news_data)
+                weather_incidents = weather_future.result()
+                news_incidents = news_future.result()
             
             all_incidents = weather_incidents + news_incidents
-            logging.info(f"Data Agent: Fetched {len(all_incidents)} total incidents")
+            logging.info("Data Agent: Fetched %s total incidents", len(all_incidents))
             
             # Trigger notification agent to process new incidents
             if all_incidents and not self.notification_agent:
@@ -33,7 +57,7 @@ class DataAgent:
                 self.notification_agent.process_incidents(all_incidents)
                 
         except Exception as e:
-            logging.error(f"Data Agent: Error in fetch cycle: {e}")
+            logging.error("Data Agent: Error in fetch cycle: %s", e)
     
     def fetch_weather_data(self):
         """Fetch weather alerts and warnings from OpenWeatherMap API"""
@@ -48,27 +72,34 @@ class DataAgent:
                 'units': 'metric'
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
             weather_data = response.json()
             
             # Check for severe weather conditions
             if 'weather' in weather_data:
+                # Shared by every condition in this response, so build them once
+                raw_data = json.dumps(
+                    {key: weather_data[key] for key in WEATHER_RAW_KEYS if key in weather_data},
+                    separators=(',', ':')
+                )
+                temperature = weather_data.get('main', {}).get('temp', 'N/A')
+                city_url = f"https://openweathermap.org/city/{weather_data.get('id', '')}"
+                
                 for weather in weather_data['weather']:
                     main = weather.get('main', '').lower()
                     description = weather.get('description', '')
                     
                     # Check for severe weather conditions
-                    severe_conditions = ['thunderstorm', 'snow', 'rain', 'drizzle', 'mist', 'fog']
-                    if any(condition in main for condition in severe_conditions):
+                    if main in SEVERE_CONDITIONS:
                         incident_data = {
                             'title': f"Weather Alert: {weather.get('main', 'Unknown')}",
-                            'description': f"Current weather conditions: {description}. Temperature: {weather_data.get('main', {}).get('temp', 'N/A')}°C",
+                            'description': f"Current weather conditions: {description}. Temperature: {temperature}°C",
                             'source': 'weather',
                             'location': self.default_location,
                             'category': 'weather',
-                            'raw_data': json.dumps(weather_data),
-                            'url': f"https://openweathermap.org/city/{weather_data.get('id', '')}"
+                            'raw_data': raw_data,
+                            'url': city_url
                         }
                         incidents.append(incident_data)
             
@@ -87,7 +118,7 @@ class DataAgent:
                     'exclude': 'minutely,hourly,daily'
                 }
                 
-                alerts_response = requests.get(alerts_url, params=alerts_params, timeout=10)
+                alerts_response = self.session.get(alerts_url, params=alerts_params, timeout=10)
                 if alerts_response.status_code == 200:
                     alerts_data = alerts_response.json()
                     
@@ -99,17 +130,17 @@ class DataAgent:
                                 'source': 'weather',
                                 'location': self.default_location,
                                 'category': 'weather',
-                                'raw_data': json.dumps(alert),
+                                'raw_data': json.dumps(alert, separators=(',', ':')),
                                 'url': 'https://openweathermap.org'
                             }
                             incidents.append(incident_data)
             
-            logging.info(f"Data Agent: Fetched {len(incidents)} weather incidents")
+            logging.info("Data Agent: Fetched %s weather incidents", len(incidents))
             
         except requests.exceptions.RequestException as e:
-            logging.error(f"Data Agent: Weather API request failed: {e}")
+            logging.error("Data Agent: Weather API request failed: %s", e)
         except Exception as e:
-            logging.error(f"Data Agent: Weather data processing failed: {e}")
+            logging.error("Data Agent: Weather data processing failed: %s", e)
         
         return incidents
     
@@ -118,96 +149,67 @@ class DataAgent:
         incidents = []
         
         try:
-            # Search for local incidents and emergencies
-            keywords = ['accident', 'emergency', 'police', 'fire', 'traffic', 'closure', 'incident', 'alert', 'warning']
+            keywords = NEWS_KEYWORDS[:3]  # Limit to avoid rate limits
             
-            for keyword in keywords[:3]:  # Limit to avoid rate limits
-                url = "https://newsapi.org/v2/everything"
-                params = {
-                    'q': f'{keyword} AND {self.default_location}',
-                    'apiKey': self.news_api_key,
-                    'language': 'en',
-                    'sortBy': 'publishedAt',
-                    'pageSize': 5,
-                    'from': datetime.now().strftime('%Y-%m-%d')
-                }
-                
-                response = requests.get(url, params=params, timeout=10)
-                response.raise_for_status()
-                news_data = response.json()
-                
-                if 'articles' in news_data:
-                    for article in news_data['articles']:
-                        # Skip articles without proper content
-                        if not article.get('title') or not article.get('description'):
-                            continue
-                            
-                        # Skip removed articles
-                        if '[Removed]' in str(article.get('title', '')):
-                            continue
-                        
-                        incident_data = {
-                            'title': article.get('title', 'News Alert'),
-                            'description': article.get('description', 'Local news incident reported'),
-                            'source': 'news',
-                            'location': self.default_location,
-                            'category': 'other',  # Will be determined by AI
-                            'url': article.get('url', ''),
-                            'raw_data': json.dumps(article)
-                        }
-                        incidents.append(incident_data)
+            # Same date for every query in this cycle
+            from_date = datetime.now().strftime('%Y-%m-%d')
+            
+            # Each keyword query is an independent round-trip, so issue them concurrently
+            with ThreadPoolExecutor(max_workers=len(keywords), thread_name_prefix='news-fetch') as executor:
+                for keyword_incidents in executor.map(self.fetch_news_keyword, keywords, [from_date] * len(keywords)):
+                    incidents.extend(keyword_incidents)
             
-            logging.info(f"Data Agent: Fetched {len(incidents)} news incidents")
+            logging.info("Data Agent: Fetched %s news incidents", len(incidents))
             
         except requests.exceptions.RequestException as e:
-            logging.error(f"Data Agent: News API request failed: {e}")
+            logging.error("Data Agent: News API request failed: %s", e)
         except Exception as e:
-            logging.error(f"Data Agent: News data processing failed: {e}")
+            logging.error("Data Agent: News data processing failed: %s", e)
         
         return incidents
     
-    def save_incident(self, incident_data, analysis=None):
-        """Save incident to database with optional AI analysis"""
-        try:
-            # Check if incident already exists (avoid duplicates)
-            existing = Incident.query.filter_by(
-                title=incident_data['title'],
-                source=incident_data['source']
-            ).first()
-            
-            if existing:
-                # Update existing incident
-                existing.updated_at = datetime.utcnow()
-                if analysis:
-                    existing.ai_summary = analysis.summary
-                    existing.relevance_score = analysis.relevance_score
-                    existing.severity = analysis.severity
-                    existing.category = analysis.category
-                    existing.is_verified = analysis.is_credible
-            else:
-                # Create new incident
-                incident = Incident(
-                    title=incident_data['title'],
-                    description=incident_data['description'],
-                    source=incident_data['source'],
-                    location=incident_data['location'],
-                    category=incident_data.get('category', 'other'),
-                    url=incident_data.get('url'),
-                    raw_data=incident_data.get('raw_data')
-                )
-                
-                if analysis:
-                    incident.ai_summary = analysis.summary
-                    incident.relevance_score = analysis.relevance_score
-                    incident.severity = analysis.severity
-                    incident.category = analysis.category
-                    incident.is_verified = analysis.is_credible
+    def fetch_news_keyword(self, keyword, from_date):
+        """Fetch news articles matching a single keyword from NewsAPI"""
+        incidents = []
+        
+        url = "https://newsapi.org/v2/everything"
+        params = {
+            'q': f'{keyword} AND {self.default_location}',
+            'apiKey': self.news_api_key,
+            'language': 'en',
+            'sortBy': 'publishedAt',
+            'pageSize': 5,
+            'from': from_date
+        }
+        
+        response = self.session.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        news_data = response.json()
+        
+        if 'articles' in news_data:
+            for article in news_data['articles']:
+                # Skip articles without proper content
+                if not article.get('title') or not article.get('description'):
+                    continue
+                    
+                # Skip removed articles
+                if '[Removed]' in str(article.get('title', '')):
+                    continue
                 
-                db.session.add(incident)
-            
-            db.session.commit()
-            logging.debug(f"Data Agent: Saved incident: {incident_data['title']}")
-            
-        except Exception as e:
-            logging.error(f"Data Agent: Failed to save incident: {e}")
-            db.session.rollback()
+                incident_data = {
+                    'title': article.get('title', 'News Alert'),
+                    'description': article.get('description', 'Local news incident reported'),
+                    'source': 'news',
+                    'location': self.default_location,
+                    'category': 'other',  # Will be determined by AI
+                    'url': article.get('url', ''),
+                    # Title, description and URL are stored in their own columns already
+                    'raw_data': json.dumps({
+                        'author': article.get('author'),
+                        'source': (article.get('source') or {}).get('name'),
+                        'publishedAt': article.get('publishedAt')
+                    }, separators=(',', ':'))
+                }
+                incidents.append(incident_data)
+        
+        return incidents
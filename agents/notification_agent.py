@@ -1,106 +1,144 @@
 import logging
 from datetime import datetime, timedelta
-from app import db
-from models import Incident, User, AlertSubscription, NotificationLog
-from gemini import analyze_incident, filter_credible_sources
+from sqlalchemy import func, insert, literal, or_, select, update
+from sqlalchemy.orm import raiseload
+from app import db, read_session
+from models import Incident, User, AlertSubscription, NotificationLog, INCIDENT_API_COLUMNS, incident_row_to_dict
+from gemini import analyze_incidents_batch
 from utils.email_service import EmailService
 
+SEVERITY_LEVELS = {'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
+
+# Incidents at these severities trigger email notifications
+NOTIFY_SEVERITIES = frozenset({'high', 'critical'})
+
 class NotificationAgent:
     def __init__(self):
         self.email_service = EmailService()
         
     def process_incidents(self, incident_data_list):
         """Process new incidents with AI analysis and send notifications"""
-        logging.info(f"Notification Agent: Processing {len(incident_data_list)} incidents")
+        logging.info("Notification Agent: Processing %s incidents", len(incident_data_list))
         
-        processed_incidents = []
+        # Drop incidents we already know about before paying for AI analysis
+        new_incident_data, existing_ids = self.filter_new_incidents(incident_data_list)
         
-        for incident_data in incident_data_list:
-            try:
-                # Use Gemini AI to analyze the incident
-                analysis = analyze_incident(
-                    title=incident_data['title'],
-                    description=incident_data['description'],
-                    source=incident_data['source'],
-                    location=incident_data['location']
-                )
-                
-                # Additional credibility check
-                is_credible = filter_credible_sources(
-                    content=incident_data['description'],
-                    source_url=incident_data.get('url', '')
-                )
-                
-                # Override AI decision if our filter disagrees
-                if not is_credible:
-                    analysis.is_credible = False
-                    analysis.relevance_score *= 0.5  # Reduce relevance for non-credible sources
+        analyzed_incidents = []
+        
+        if new_incident_data:
+            # Use Gemini AI to analyze the incidents, a whole batch per request
+            analyses = analyze_incidents_batch(new_incident_data)
+            for incident_data, analysis in zip(new_incident_data, analyses):
+                # Failed analyses are not saved, so the next fetch cycle retries them
+                if analysis is None:
+                    continue
                 
                 # Only process incidents that meet minimum criteria
                 if analysis.relevance_score >= 0.3 and analysis.is_credible:
-                    # Save to database
-                    incident = self.save_analyzed_incident(incident_data, analysis)
-                    if incident:
-                        processed_incidents.append(incident)
-                        
-                        # Send notifications for high-priority incidents
-                        if analysis.severity in ['high', 'critical'] and analysis.relevance_score >= 0.7:
-                            self.send_notifications(incident)
-                
+                    analyzed_incidents.append((incident_data, analysis))
+        
+        # Save the whole batch to the database in a single transaction
+        try:
+            if existing_ids:
+                # Incidents reported again are still current
+                db.session.execute(
+                    update(Incident).where(Incident.id.in_(existing_ids)).values(updated_at=datetime.utcnow())
+                )
+            processed_incidents = self.save_analyzed_incidents(analyzed_incidents)
+            db.session.commit()
+        except Exception as e:
+            logging.error("Notification Agent: Failed to save incidents: %s", e)
+            db.session.rollback()
+            processed_incidents = []
+        
+        notification_logs = []
+        for incident in processed_incidents:
+            # Send notifications for high-priority incidents
+            if incident.severity in NOTIFY_SEVERITIES and incident.relevance_score >= 0.7:
+                notification_logs.extend(self.send_notifications(incident))
+        
+        if notification_logs:
+            # Write all log entries for the batch with a single executemany INSERT
+            try:
+                db.session.execute(insert(NotificationLog), notification_logs)
+                db.session.commit()
             except Exception as e:
-                logging.error(f"Notification Agent: Error processing incident {incident_data.get('title', '')}: {e}")
+                logging.error("Notification Agent: Failed to save notification logs: %s", e)
+                db.session.rollback()
         
-        logging.info(f"Notification Agent: Successfully processed {len(processed_incidents)} incidents")
+        logging.info("Notification Agent: Successfully processed %s incidents", len(processed_incidents))
         return processed_incidents
     
-    def save_analyzed_incident(self, incident_data, analysis):
-        """Save incident with AI analysis to database"""
+    def filter_new_incidents(self, incident_data_list):
+        """Split incidents into new ones and ids of those already saved in the last 24 hours"""
+        if not incident_data_list:
+            return [], []
+        
         try:
-            # Check for existing incident to avoid duplicates
-            existing = Incident.query.filter_by(
-                title=incident_data['title'],
-                source=incident_data['source']
-            ).filter(
-                Incident.created_at >= datetime.utcnow() - timedelta(hours=24)
-            ).first()
-            
-            if existing:
-                # Update existing incident with new analysis
-                existing.ai_summary = analysis.summary
-                existing.relevance_score = analysis.relevance_score
-                existing.severity = analysis.severity
-                existing.category = analysis.category
-                existing.is_verified = analysis.is_credible
-                existing.updated_at = datetime.utcnow()
-                incident = existing
-            else:
-                # Create new incident
-                incident = Incident(
-                    title=incident_data['title'],
-                    description=incident_data['description'],
-                    source=incident_data['source'],
-                    location=incident_data['location'],
-                    category=analysis.category,
-                    severity=analysis.severity,
-                    url=incident_data.get('url'),
-                    raw_data=incident_data.get('raw_data'),
-                    ai_summary=analysis.summary,
-                    relevance_score=analysis.relevance_score,
-                    is_verified=analysis.is_credible
+            # Check for existing incidents to avoid duplicates, one query for the whole batch
+            titles = [incident_data['title'] for incident_data in incident_data_list]
+            rows = db.session.execute(
+                select(Incident.title, Incident.source, Incident.id).where(
+                    Incident.title.in_(titles),
+                    Incident.created_at >= datetime.utcnow() - timedelta(hours=24)
                 )
-                db.session.add(incident)
-            
-            db.session.commit()
-            logging.debug(f"Notification Agent: Saved incident {incident.id}: {incident.title}")
-            return incident
+            ).all()
+            existing_map = {(title, source): incident_id for title, source, incident_id in rows}
             
         except Exception as e:
-            logging.error(f"Notification Agent: Failed to save incident: {e}")
-            db.session.rollback()
-            return None
+            logging.error("Notification Agent: Error checking for existing incidents: %s", e)
+            existing_map = {}
+        
+        new_incident_data = []
+        existing_ids = set()
+        seen = set()
+        for incident_data in incident_data_list:
+            key = (incident_data['title'], incident_data['source'])
+            if key in existing_map:
+                existing_ids.add(existing_map[key])
+            elif key not in seen:
+                # The same headline can show up under more than one news keyword
+                seen.add(key)
+                new_incident_data.append(incident_data)
+        
+        logging.debug("Notification Agent: Skipping %s duplicate incidents", len(incident_data_list) - len(new_incident_data))
+        return new_incident_data, list(existing_ids)
+    
+    def save_analyzed_incidents(self, analyzed_incidents):
+        """Insert a batch of new (incident_data, analysis) pairs; the caller commits"""
+        if not analyzed_incidents:
+            return []
+        
+        new_incidents = [
+            {
+                'title': incident_data['title'],
+                'description': incident_data['description'],
+                'source': incident_data['source'],
+                'location': incident_data['location'],
+                'category': analysis.category,
+                'severity': analysis.severity,
+                'url': incident_data.get('url'),
+                'raw_data': incident_data.get('raw_data'),
+                'ai_summary': analysis.summary,
+                'relevance_score': analysis.relevance_score,
+                'is_verified': analysis.is_credible
+            }
+            for incident_data, analysis in analyzed_incidents
+        ]
+        
+        # Bulk insert new incidents, returning ORM objects for notification
+        incidents = db.session.scalars(
+            insert(Incident).returning(Incident),
+            new_incidents
+        ).all()
+        
+        logging.debug("Notification Agent: Saved %s new incidents", len(incidents))
+        return incidents
     
     def send_notifications(self, incident):
-        """Send notifications to subscribed users for high-priority incidents"""
+        """Send notifications to subscribed users and return NotificationLog rows for the caller to save"""
+        notification_logs = []
+        
         try:
             # Get users who should receive this notification
             eligible_users = self.get_eligible_users(incident)
@@ -112,76 +150,73 @@ class NotificationAgent:
                         success = self.email_service.send_alert_email(user, incident)
                         
                         # Log notification attempt
-                        log_entry = NotificationLog(
-                            incident_id=incident.id,
-                            user_id=user.id,
-                            notification_type='email',
-                            status='sent' if success else 'failed',
-                            error_message=None if success else 'Email sending failed'
-                        )
-                        db.session.add(log_entry)
+                        notification_logs.append({
+                            'incident_id': incident.id,
+                            'user_id': user.id,
+                            'notification_type': 'email',
+                            'status': 'sent' if success else 'failed',
+                            'error_message': None if success else 'Email sending failed'
+                        })
                 
                 except Exception as e:
-                    logging.error(f"Notification Agent: Failed to send notification to user {user.id}: {e}")
+                    logging.error("Notification Agent: Failed to send notification to user %s: %s", user.id, e)
                     
                     # Log failed notification
-                    log_entry = NotificationLog(
-                        incident_id=incident.id,
-                        user_id=user.id,
-                        notification_type='email',
-                        status='failed',
-                        error_message=str(e)
-                    )
-                    db.session.add(log_entry)
+                    notification_logs.append({
+                        'incident_id': incident.id,
+                        'user_id': user.id,
+                        'notification_type': 'email',
+                        'status': 'failed',
+                        'error_message': str(e)
+                    })
             
-            db.session.commit()
-            logging.info(f"Notification Agent: Sent notifications for incident {incident.id} to {len(eligible_users)} users")
+            logging.info("Notification Agent: Sent notifications for incident %s to %s users", incident.id, len(eligible_users))
             
         except Exception as e:
-            logging.error(f"Notification Agent: Error sending notifications for incident {incident.id}: {e}")
-            db.session.rollback()
+            logging.error("Notification Agent: Error sending notifications for incident %s: %s", incident.id, e)
+        
+        return notification_logs
     
     def get_eligible_users(self, incident):
         """Get users who should receive notifications for this incident"""
         try:
-            # Get users with active subscriptions matching this incident
-            eligible_users = []
+            # Check severity threshold (assuming users want medium+ severity by default)
+            if SEVERITY_LEVELS.get(incident.severity, 2) < 2:
+                return []
             
-            # Simple matching for now - can be enhanced with more sophisticated location/category matching
-            users = User.query.filter_by(email_notifications=True).all()
-            
-            for user in users:
-                # Check if user's location matches (simple string matching)
-                if user.location.lower() in incident.location.lower() or incident.location.lower() in user.location.lower():
-                    # Check severity threshold (assuming users want medium+ severity by default)
-                    severity_levels = {'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
-                    incident_severity_level = severity_levels.get(incident.severity, 2)
-                    
-                    if incident_severity_level >= 2:  # medium or higher
-                        eligible_users.append(user)
-            
-            return eligible_users
+            # Simple matching for now - can be enhanced with more sophisticated location/category matching.
+            # Location matches when either side contains the other, case-insensitively.
+            # Subscriber locations are free text, so LIKE wildcards are escaped on the column side too.
+            escaped_location = func.replace(
+                func.replace(func.replace(User.location, '\\', '\\\\'), '%', '\\%'), '_', '\\_'
+            )
+            # Only column attributes are read when emailing; fail loudly on accidental lazy loads
+            return User.query.options(raiseload('*')).filter(
+                User.email_notifications == True,
+                or_(
+                    User.location.icontains(incident.location, autoescape=True),
+                    literal(incident.location).icontains(escaped_location, escape='\\')
+                )
+            ).all()
             
         except Exception as e:
-            logging.error(f"Notification Agent: Error finding eligible users: {e}")
+            logging.error("Notification Agent: Error finding eligible users: %s", e)
             return []
     
-    def get_recent_incidents(self, hours=24, min_relevance=0.3):
-        """Get recent incidents for dashboard display"""
-        try:
-            cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-            
-            incidents = Incident.query.filter(
+    def get_recent_incidents_data(self, hours=24, min_relevance=0.3):
+        """Get recent incidents for dashboard display as dicts; database errors propagate to the caller"""
+        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+        
+        # Project only the API columns; no ORM objects are needed for serialization
+        rows = read_session.execute(
+            select(*INCIDENT_API_COLUMNS).where(
                 Incident.created_at >= cutoff_time,
                 Incident.relevance_score >= min_relevance,
                 Incident.is_verified == True
             ).order_by(
                 Incident.relevance_score.desc(),
                 Incident.created_at.desc()
-            ).limit(20).all()
-            
-            return incidents
-            
-        except Exception as e:
-            logging.error(f"Notification Agent: Error fetching recent incidents: {e}")
-            return []
+            ).limit(20)
+        ).all()
+        
+        return [incident_row_to_dict(row) for row in rows]
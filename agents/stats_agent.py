@@ -0,0 +1,112 @@
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, func, select
+from app import db, read_session
+from models import Incident, IncidentHourlyRollup, UPSERT_INSERTS
+
+# Hourly buckets older than this are pruned from the rollup
+ROLLUP_WINDOW = timedelta(hours=24)
+
+# Statistics fall back to the incident table when the rollup hasn't been refreshed for this long
+ROLLUP_MAX_AGE = 300  # seconds
+
+# Monotonic time of the last successful rollup refresh in this process
+_last_refresh = None
+
+# Hour bucket (UTC) in which that refresh ran; later refreshes recount from here
+_last_refresh_bucket = None
+
+def _hour_bucket(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+class StatsAgent:
+    def refresh_rollup(self):
+        """Recompute hourly incident counts for the most recent buckets"""
+        global _last_refresh, _last_refresh_bucket
+        
+        try:
+            current_bucket = _hour_bucket(datetime.utcnow())
+            
+            # Backfill the whole 24 hour window on the first run. Later runs recount from the hour before
+            # the last successful refresh, so buckets missed while refreshes were failing are caught up.
+            if _last_refresh_bucket is None:
+                start = current_bucket - ROLLUP_WINDOW
+            else:
+                start = max(_last_refresh_bucket - timedelta(hours=1), current_bucket - ROLLUP_WINDOW)
+            
+            rows = db.session.execute(
+                select(Incident.created_at, Incident.severity, Incident.source, Incident.is_verified).where(
+                    Incident.created_at >= start
+                )
+            ).all()
+            
+            counts = Counter(
+                (_hour_bucket(created_at), severity, source, bool(is_verified))
+                for created_at, severity, source, is_verified in rows
+            )
+            
+            # Upsert rather than delete-and-insert, so workers refreshing concurrently don't collide on the key.
+            # Incidents are insert-only, so a recount never drops a group that is already in the rollup.
+            if counts:
+                upsert = UPSERT_INSERTS[db.engine.dialect.name](IncidentHourlyRollup)
+                db.session.execute(upsert.on_conflict_do_update(
+                    index_elements=['bucket', 'severity', 'source', 'is_verified'],
+                    set_={'incident_count': upsert.excluded.incident_count}
+                ), [
+                    {
+                        'bucket': bucket,
+                        'severity': severity,
+                        'source': source,
+                        'is_verified': is_verified,
+                        'incident_count': incident_count
+                    }
+                    for (bucket, severity, source, is_verified), incident_count in counts.items()
+                ])
+            db.session.execute(
+                delete(IncidentHourlyRollup).where(IncidentHourlyRollup.bucket < current_bucket - ROLLUP_WINDOW)
+            )
+            db.session.commit()
+            
+            _last_refresh = time.monotonic()
+            _last_refresh_bucket = current_bucket
+            logging.debug("Stats Agent: Refreshed incident rollup since %s", start.isoformat())
+            
+        except Exception as e:
+            logging.error("Stats Agent: Failed to refresh incident rollup: %s", e)
+            db.session.rollback()
+    
+    def is_rollup_fresh(self):
+        """Whether the rollup was refreshed recently enough to serve statistics"""
+        return _last_refresh is not None and time.monotonic() - _last_refresh < ROLLUP_MAX_AGE
+    
+    def get_incident_counts(self, since):
+        """Get (total, critical, high, weather, news) counts of verified incidents since a time"""
+        if self.is_rollup_fresh():
+            # Sum over ~24 hourly rows; counts are approximate to the hour at the start of the window
+            rollup = IncidentHourlyRollup
+            counts = read_session.query(
+                func.sum(rollup.incident_count),
+                func.sum(case((rollup.severity == 'critical', rollup.incident_count), else_=0)),
+                func.sum(case((rollup.severity == 'high', rollup.incident_count), else_=0)),
+                func.sum(case((rollup.source == 'weather', rollup.incident_count), else_=0)),
+                func.sum(case((rollup.source == 'news', rollup.incident_count), else_=0))
+            ).filter(
+                rollup.bucket >= _hour_bucket(since),
+                rollup.is_verified == True
+            ).one()
+        else:
+            # One aggregate query instead of a COUNT per statistic
+            counts = read_session.query(
+                func.count(Incident.id),
+                func.sum(case((Incident.severity == 'critical', 1), else_=0)),
+                func.sum(case((Incident.severity == 'high', 1), else_=0)),
+                func.sum(case((Incident.source == 'weather', 1), else_=0)),
+                func.sum(case((Incident.source == 'news', 1), else_=0))
+            ).filter(
+                Incident.created_at >= since,
+                Incident.is_verified == True
+            ).one()
+        
+        return tuple(count or 0 for count in counts)
@@ -1,24 +1,51 @@
 import os
 import logging
+import orjson
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from flask import Flask
+from flask.json.provider import JSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, scoped_session, sessionmaker
 from werkzeug.middleware.proxy_fix import ProxyFix
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 import atexit
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Request and scheduler threads only enqueue records; a listener thread does the writing
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+log_listener = QueueListener(queue.SimpleQueue(), log_handler, respect_handler_level=True)
+logging.root.addHandler(QueueHandler(log_listener.queue))
+logging.root.setLevel(logging.DEBUG)
+log_listener.start()
+atexit.register(log_listener.stop)
 
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
 
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson, used by jsonify and the session serializer"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
 # Create the app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
@@ -26,17 +53,30 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 CORS(app)
 
 # Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///cityguard.db")
+database_url = os.environ.get("DATABASE_URL", "sqlite:///cityguard.db")
+app.config["SQLALCHEMY_DATABASE_URI"] = database_url
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
+    # Sized for Flask workers plus the scheduler; LIFO keeps a small set of connections warm
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_use_lifo": True,
 }
+if database_url.startswith(("postgres://", "postgresql")):
+    # Don't let a runaway query hold a pooled connection indefinitely
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {"options": "-c statement_timeout=5000"}
 
 # Initialize the app with the extension
 db.init_app(app)
 
 # Initialize scheduler
-scheduler = BackgroundScheduler()
+# A single dedicated worker thread; overlapping fetch cycles are coalesced instead of piling up.
+# The stats rollup gets its own thread so a long fetch cycle doesn't hold it back.
+scheduler = BackgroundScheduler(
+    executors={'default': ThreadPoolExecutor(max_workers=1), 'stats': ThreadPoolExecutor(max_workers=1)},
+    job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 120}
+)
 scheduler.start()
 
 with app.app_context():
@@ -44,32 +84,62 @@ with app.app_context():
     import models  # noqa: F401
     db.create_all()
     
+    # Session for pure-SELECT endpoints: autocommit connections from the same pool skip BEGIN/COMMIT
+    read_session = scoped_session(sessionmaker(bind=db.engine.execution_options(isolation_level="AUTOCOMMIT")))
+    
+    @app.teardown_appcontext
+    def remove_read_session(exception=None):
+        read_session.remove()
+    
     # Import and register routes
     import routes  # noqa: F401
     
     # Import agents and start background tasks
     from agents.data_agent import DataAgent
     from agents.notification_agent import NotificationAgent
+    from agents.stats_agent import StatsAgent
     
     # Initialize agents
     data_agent = DataAgent()
     notification_agent = NotificationAgent()
+    stats_agent = StatsAgent()
+    
+    # Schedule data fetching every 10 minutes; jobs run on the scheduler thread, outside any request
+    def fetch_all_data():
+        with app.app_context():
+            data_agent.fetch_all_data()
     
-    # Schedule data fetching every 10 minutes
     scheduler.add_job(
-        func=data_agent.fetch_all_data,
+        func=fetch_all_data,
         trigger=IntervalTrigger(minutes=10),
         id='fetch_data_job',
         name='Fetch weather and news data',
         replace_existing=True
     )
     
+    # Refresh the hourly stats rollup every minute
+    def refresh_incident_rollup():
+        with app.app_context():
+            stats_agent.refresh_rollup()
+    
+    scheduler.add_job(
+        func=refresh_incident_rollup,
+        trigger=IntervalTrigger(minutes=1),
+        executor='stats',
+        id='refresh_rollup_job',
+        name='Refresh hourly incident rollup',
+        replace_existing=True
+    )
+    
     # Initial data fetch
     try:
         data_agent.fetch_all_data()
         logging.info("Initial data fetch completed")
     except Exception as e:
-        logging.error(f"Initial data fetch failed: {e}")
+        logging.error("Initial data fetch failed: %s", e)
+    
+    # Initial rollup so statistics are served from it straight away
+    stats_agent.refresh_rollup()
 
 # Shut down the scheduler when exiting the app
 atexit.register(lambda: scheduler.shutdown())
@@ -1,6 +1,9 @@
 import json
 import logging
 import os
+import threading
+import time
+from collections import OrderedDict
 
 from google import genai
 from google.genai import types
@@ -23,53 +26,144 @@ class IncidentAnalysis(BaseModel):
     is_credible: bool
     summary: str
 
-def analyze_incident(title: str, description: str, source: str, location: str) -> IncidentAnalysis:
-    """Analyze an incident for relevance, severity, and credibility using Gemini AI"""
-    try:
-        system_prompt = (
-            "You are an expert incident analyst for a local alert system. "
-            "Analyze the following incident and provide a structured assessment. "
-            "Relevance score should be 0.0-1.0 (1.0 = highly relevant to local safety). "
-            "Severity should be: low, medium, high, or critical. "
-            "Category should be one of: weather, traffic, crime, emergency, infrastructure, health, other. "
-            "Is_credible should assess if this is from a reliable source and not misinformation. "
-            "Summary should be a concise 1-2 sentence summary suitable for alerts. "
-            "Consider local impact and immediate relevance to residents."
-        )
-        
-        incident_text = f"Title: {title}\nDescription: {description}\nSource: {source}\nLocation: {location}"
-        
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=[
-                types.Content(role="user", parts=[types.Part(text=incident_text)])
-            ],
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                response_mime_type="application/json",
-                response_schema=IncidentAnalysis,
-            ),
-        )
-
-        raw_json = response.text
-        logging.debug(f"Gemini analysis response: {raw_json}")
-
-        if raw_json:
-            data = json.loads(raw_json)
-            return IncidentAnalysis(**data)
-        else:
-            raise ValueError("Empty response from Gemini model")
-
-    except Exception as e:
-        logging.error(f"Failed to analyze incident with Gemini: {e}")
-        # Return default analysis if AI fails
-        return IncidentAnalysis(
-            relevance_score=0.5,
-            severity="medium",
-            category="other",
-            is_credible=True,
-            summary=f"{title}: {description[:100]}..."
-        )
+class BatchIncidentAnalysis(IncidentAnalysis):
+    index: int  # the "Incident N" number the assessment refers to
+
+ANALYSIS_SYSTEM_PROMPT = (
+    "You are an expert incident analyst for a local alert system. "
+    "Analyze the following incident and provide a structured assessment. "
+    "Relevance score should be 0.0-1.0 (1.0 = highly relevant to local safety). "
+    "Severity should be: low, medium, high, or critical. "
+    "Category should be one of: weather, traffic, crime, emergency, infrastructure, health, other. "
+    "Is_credible should assess if this is from a reliable source and not misinformation. "
+    "Treat official sources, known news outlets, weather services and government agencies as credible; "
+    "use the source URL when one is given. "
+    "Summary should be a concise 1-2 sentence summary suitable for alerts. "
+    "Consider local impact and immediate relevance to residents."
+)
+
+# Maximum number of incidents sent to Gemini in a single batch request
+ANALYSIS_BATCH_SIZE = 15
+
+# Recent analyses keyed by incident content, so re-fetched incidents skip Gemini
+ANALYSIS_CACHE_SIZE = 2048
+_analysis_cache = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+# Circuit breaker: after this many consecutive failed requests, skip Gemini for a cool-down period.
+# Sized for batched analysis, which makes only a request or two per 10 minute fetch cycle.
+GEMINI_FAILURE_THRESHOLD = 3
+GEMINI_COOLDOWN = 900  # seconds
+_gemini_failures = 0
+_gemini_open_until = 0.0
+_gemini_failures_lock = threading.Lock()
+
+def _gemini_circuit_open() -> bool:
+    with _gemini_failures_lock:
+        return time.monotonic() < _gemini_open_until
+
+def _record_gemini_failure():
+    global _gemini_failures, _gemini_open_until
+    with _gemini_failures_lock:
+        _gemini_failures += 1
+        # Past the threshold, each failure (including the first trial after a cool-down) reopens the circuit
+        if _gemini_failures >= GEMINI_FAILURE_THRESHOLD:
+            _gemini_open_until = time.monotonic() + GEMINI_COOLDOWN
+
+def _record_gemini_success():
+    global _gemini_failures
+    with _gemini_failures_lock:
+        _gemini_failures = 0
+
+def _analysis_cache_key(title: str, description: str, source: str, location: str, source_url: str) -> tuple:
+    return (title, description, source, location, source_url)
+
+def _get_cached_analysis(key: tuple):
+    with _analysis_cache_lock:
+        analysis = _analysis_cache.get(key)
+        if analysis is None:
+            return None
+        _analysis_cache.move_to_end(key)
+    # Copy so callers can't mutate the cached instance
+    return analysis.model_copy()
+
+def _cache_analysis(key: tuple, analysis: IncidentAnalysis):
+    with _analysis_cache_lock:
+        _analysis_cache[key] = analysis.model_copy()
+        _analysis_cache.move_to_end(key)
+        if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+
+def _format_incident(title: str, description: str, source: str, location: str, source_url: str) -> str:
+    incident_text = f"Title: {title}\nDescription: {description}\nSource: {source}\nLocation: {location}"
+    if source_url:
+        incident_text += f"\nSource URL: {source_url}"
+    return incident_text
+
+def analyze_incidents_batch(items: list) -> list:
+    """Analyze a list of incident dicts with one Gemini request per batch, preserving order; None where analysis failed"""
+    keys = [
+        _analysis_cache_key(item['title'], item['description'], item['source'], item['location'], item.get('url') or "")
+        for item in items
+    ]
+    results = [_get_cached_analysis(key) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    for start in range(0, len(pending), ANALYSIS_BATCH_SIZE):
+        chunk = pending[start:start + ANALYSIS_BATCH_SIZE]
+
+        if _gemini_circuit_open():
+            logging.debug("Gemini circuit open, leaving incident batch unanalyzed")
+            continue
+
+        try:
+            incidents_text = "\n\n".join(
+                f"Incident {n}:\n{_format_incident(*keys[i])}" for n, i in enumerate(chunk, start=1)
+            )
+
+            response = client.models.generate_content(
+                model="gemini-2.5-pro",
+                contents=[
+                    types.Content(role="user", parts=[types.Part(text=incidents_text)])
+                ],
+                config=types.GenerateContentConfig(
+                    system_instruction=(
+                        ANALYSIS_SYSTEM_PROMPT +
+                        f" You will receive {len(chunk)} numbered incidents; return exactly one assessment per incident, "
+                        "with index set to the number of the incident it assesses."
+                    ),
+                    response_mime_type="application/json",
+                    response_schema=list[BatchIncidentAnalysis],
+                ),
+            )
+
+            raw_json = response.text
+            logging.debug("Gemini batch analysis response: %s", raw_json)
+
+            if not raw_json:
+                raise ValueError("Empty response from Gemini model")
+
+            # Match assessments to incidents by index, never by position in the returned list
+            analyses = {}
+            for analysis_data in json.loads(raw_json):
+                batch_analysis = BatchIncidentAnalysis(**analysis_data)
+                if batch_analysis.index in analyses:
+                    raise ValueError(f"Duplicate analysis index {batch_analysis.index} from Gemini model")
+                analyses[batch_analysis.index] = IncidentAnalysis(**batch_analysis.model_dump(exclude={'index'}))
+            if analyses.keys() != set(range(1, len(chunk) + 1)):
+                raise ValueError(f"Expected analyses for incidents 1-{len(chunk)} from Gemini model, got {sorted(analyses)}")
+
+            for n, i in enumerate(chunk, start=1):
+                _cache_analysis(keys[i], analyses[n])
+                results[i] = analyses[n]
+            _record_gemini_success()
+
+        except Exception as e:
+            logging.error("Failed to analyze incident batch with Gemini: %s", e)
+            _record_gemini_failure()
+            # Leave the chunk unanalyzed (None) so callers can retry it rather than save a guess
+
+    return results
 
 def summarize_multiple_incidents(incidents: list) -> str:
     """Generate a summary of multiple incidents for dashboard display"""
@@ -77,6 +171,9 @@ def summarize_multiple_incidents(incidents: list) -> str:
         if not incidents:
             return "No active incidents in your area."
         
+        if _gemini_circuit_open():
+            return f"Found {len(incidents)} active incidents. Check individual alerts for details."
+        
         incidents_text = "\n".join([
             f"- {inc.get('title', '')}: {inc.get('ai_summary', inc.get('description', ''))[:100]}"
             for inc in incidents[:10]  # Limit to top 10 incidents
@@ -92,32 +189,11 @@ def summarize_multiple_incidents(incidents: list) -> str:
             model="gemini-2.5-flash",
             contents=prompt
         )
+        _record_gemini_success()
 
         return response.text or "Multiple incidents reported. Check individual alerts for details."
 
     except Exception as e:
-        logging.error(f"Failed to summarize incidents: {e}")
+        logging.error("Failed to summarize incidents: %s", e)
+        _record_gemini_failure()
         return f"Found {len(incidents)} active incidents. Check individual alerts for details."
-
-def filter_credible_sources(content: str, source_url: str = "") -> bool:
-    """Use Gemini to assess if content comes from a credible source"""
-    try:
-        prompt = (
-            "Assess if this content appears to be from a credible news or weather source. "
-            "Consider: official sources, known news outlets, weather services, government agencies. "
-            "Return only 'true' or 'false'.\n\n"
-            f"Content: {content[:500]}\n"
-            f"Source URL: {source_url}"
-        )
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-
-        result = response.text.strip().lower() if response.text else ""
-        return result == "true"
-
-    except Exception as e:
-        logging.error(f"Failed to assess source credibility: {e}")
-        return True  # Default to allowing content if AI fails
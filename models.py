@@ -1,14 +1,19 @@
 from app import db
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Dialect-specific INSERT constructs that support ON CONFLICT clauses
+UPSERT_INSERTS = {'postgresql': postgresql_insert, 'sqlite': sqlite_insert}
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256))
-    location = db.Column(db.String(100), nullable=False, default='New York')
-    email_notifications = db.Column(db.Boolean, default=True)
+    location = db.Column(db.String(100), nullable=False, default='New York', index=True)
+    email_notifications = db.Column(db.Boolean, default=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -23,13 +28,24 @@ class Incident(db.Model):
     severity = db.Column(db.String(20), nullable=False, default='medium')  # low, medium, high, critical
     category = db.Column(db.String(50), nullable=False)
     url = db.Column(db.String(500))
-    raw_data = db.Column(db.Text)  # JSON string of original API response
+    raw_data = db.deferred(db.Column(db.Text))  # JSON string of the relevant parts of the original API response; loaded on access
     ai_summary = db.Column(db.Text)
     relevance_score = db.Column(db.Float, default=0.0)
     is_verified = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_incident_title_source', 'title', 'source'),  # duplicate checks
+        db.Index('ix_incident_dashboard', 'is_verified', 'relevance_score', 'created_at'),  # recent incidents
+        db.Index('ix_incident_created_at', 'created_at'),
+        db.Index('ix_incident_stats', 'is_verified', 'created_at', 'severity', 'source'),  # 24h stats
+        # Newest-first feeds filtered by severity or source
+        db.Index('ix_incident_severity_feed', 'is_verified', 'severity', created_at.desc()),
+        db.Index('ix_incident_source_feed', 'is_verified', 'source', created_at.desc(),
+                 postgresql_include=['relevance_score']),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -47,6 +63,41 @@ class Incident(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+# Columns exposed by the API, in to_dict() order, for lightweight row projections
+INCIDENT_API_COLUMNS = (
+    Incident.id, Incident.title, Incident.description, Incident.source, Incident.location,
+    Incident.severity, Incident.category, Incident.url, Incident.ai_summary,
+    Incident.relevance_score, Incident.is_verified, Incident.created_at, Incident.updated_at
+)
+
+def _build_incident_row_to_dict():
+    """Generate a straight-line serializer for INCIDENT_API_COLUMNS rows, specialized to the schema"""
+    names = [f"c{i}" for i in range(len(INCIDENT_API_COLUMNS))]
+    items = []
+    for name, column in zip(names, INCIDENT_API_COLUMNS):
+        value = f"{name}.isoformat() if {name} else None" if isinstance(column.type, db.DateTime) else name
+        items.append(f"{column.key!r}: {value}")
+    source = (
+        "def incident_row_to_dict(row):\n"
+        f"    {', '.join(names)}, = row\n"
+        f"    return {{{', '.join(items)}}}\n"
+    )
+    namespace = {}
+    exec(compile(source, "<incident_row_to_dict>", "exec"), namespace)
+    serializer = namespace['incident_row_to_dict']
+    serializer.__doc__ = "Build the to_dict() payload from a row selected with INCIDENT_API_COLUMNS"
+    return serializer
+
+incident_row_to_dict = _build_incident_row_to_dict()
+
+class IncidentHourlyRollup(db.Model):
+    """Incident counts per hour bucket, maintained by StatsAgent for dashboard statistics"""
+    bucket = db.Column(db.DateTime, primary_key=True)  # start of the hour (UTC)
+    severity = db.Column(db.String(20), primary_key=True)
+    source = db.Column(db.String(50), primary_key=True)
+    is_verified = db.Column(db.Boolean, primary_key=True)
+    incident_count = db.Column(db.Integer, nullable=False, default=0)
+
 class AlertSubscription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
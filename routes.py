@@ -1,29 +1,177 @@
-from flask import render_template, request, jsonify, redirect, url_for, flash
-from app import app, db
-from models import User, Incident, AlertSubscription
+from flask import render_template, request, jsonify, redirect, url_for, flash, session, stream_with_context
+from app import app, db, read_session
+from models import User, Incident, AlertSubscription, INCIDENT_API_COLUMNS, UPSERT_INSERTS, incident_row_to_dict
 from agents.notification_agent import NotificationAgent
+from agents.stats_agent import StatsAgent
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import func, select
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, ValidationError
+import hashlib
 import logging
+import math
+import orjson
+import threading
+import time
 
 notification_agent = NotificationAgent()
+stats_agent = StatsAgent()
+
+VALID_SEVERITIES = frozenset({'low', 'medium', 'high', 'critical'})
+
+_ONE_DAY = timedelta(hours=24)
+
+def _utcnow():
+    """Current UTC time as a naive datetime, matching how incident timestamps are stored"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Bounds for incident list query args, so a single request can't scan the whole table
+MAX_QUERY_HOURS = 168
+
+@dataclass(frozen=True, slots=True)
+class IncidentsQuery:
+    hours: int
+    min_relevance: float
+
+def parse_q():
+    """Parse the hours/min_relevance query args, clamped to sane bounds"""
+    hours = min(max(request.args.get('hours', 24, type=int), 1), MAX_QUERY_HOURS)
+    min_relevance = request.args.get('min_relevance', 0.3, type=float)
+    if not math.isfinite(min_relevance):
+        min_relevance = 0.3
+    return IncidentsQuery(hours, min(max(min_relevance, 0.0), 1.0))
+
+class SubscribeForm(BaseModel):
+    """Subscription form fields, trimmed and validated against the User column sizes"""
+    model_config = ConfigDict(str_strip_whitespace=True)
+    
+    username: str = Field(min_length=1, max_length=64)
+    email: EmailStr = Field(max_length=120)
+    location: str = Field(min_length=1, max_length=100)
+
+def subscribe_form_error(error):
+    """Pick the flash message for the first problem in a SubscribeForm validation error"""
+    first = error.errors()[0]
+    if first['type'] in ('missing', 'string_too_short'):
+        return 'Please fill in all required fields.'
+    if first['loc'] == ('email',):
+        return 'Please enter a valid email address.'
+    return f"{first['loc'][0].capitalize()} is too long."
+
+# Rendered HTML of pages with no server-side data, keyed by template name
+_page_cache = {}
+
+def render_cached_page(template_name):
+    """Render a static page once and serve the stored bytes afterwards"""
+    # Pending flash messages are rendered into the page, and reloadable templates may change
+    if '_flashes' in session or app.jinja_env.auto_reload:
+        return render_template(template_name)
+    
+    body = _page_cache.get(template_name)
+    if body is None:
+        body = _page_cache[template_name] = render_template(template_name).encode('utf-8')
+    return app.response_class(body, mimetype='text/html')
+
+# Rows fetched from the database per chunk of a streamed response
+STREAM_BATCH_SIZE = 500
+
+def stream_incidents_response(rows, **extra):
+    """Stream a JSON incident list chunk by chunk instead of building it in memory"""
+    def generate():
+        count = 0
+        yield b'{"success":true,"incidents":['
+        try:
+            for partition in rows.partitions():
+                chunk = b','.join(orjson.dumps(incident_row_to_dict(row)) for row in partition)
+                yield (b',' if count else b'') + chunk
+                count += len(partition)
+        except Exception as e:
+            # Headers are already sent, so close the JSON and flag the list as incomplete
+            logging.error("Error streaming incidents: %s", e)
+            extra.update(truncated=True, error='Failed to fetch all incidents')
+        # Splice the trailing fields onto the incidents array
+        yield b'],' + orjson.dumps({'count': count, **extra})[1:]
+    
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+# Serialized JSON bodies of polled dashboard endpoints, keyed by path and validated query
+RESPONSE_CACHE_TTL = 15  # seconds
+RESPONSE_CACHE_SIZE = 256
+_response_cache = OrderedDict()
+_response_cache_guard = threading.Lock()
+
+# Fixed pool of recompute locks shared by hash, so distinct keys can't grow it
+RESPONSE_CACHE_LOCK_STRIPES = 64
+_response_cache_locks = tuple(threading.Lock() for _ in range(RESPONSE_CACHE_LOCK_STRIPES))
+
+# Lets browsers and proxies reuse cached read-only responses for as long as we do
+RESPONSE_CACHE_CONTROL = f'public, max-age={RESPONSE_CACHE_TTL}, stale-while-revalidate=60'
+
+def _cached_json(body, etag):
+    """Build a conditional JSON response, answering If-None-Match with a 304"""
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = RESPONSE_CACHE_CONTROL
+    return response.make_conditional(request)
+
+def _get_cached_response(key):
+    with _response_cache_guard:
+        cached = _response_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return _cached_json(cached[1], cached[2])
+    return None
+
+def cached_json_response(query=None):
+    """Serve a JSON endpoint from a short-lived in-process cache of its response body, with HTTP caching headers"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Key on validated args only, so junk query strings can't create entries and evict real ones
+            key = (request.path, query() if query else None)
+            
+            response = _get_cached_response(key)
+            if response is not None:
+                return response
+            
+            # Only one request per key recomputes the payload; the rest wait and reuse it
+            with _response_cache_locks[hash(key) % RESPONSE_CACHE_LOCK_STRIPES]:
+                response = _get_cached_response(key)
+                if response is not None:
+                    return response
+                
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                
+                body = response.get_data()
+                etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+                with _response_cache_guard:
+                    _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, body, etag)
+                    _response_cache.move_to_end(key)
+                    while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                        _response_cache.popitem(last=False)
+                return _cached_json(body, etag)
+        
+        return wrapper
+    
+    return decorator
 
 @app.route('/')
 def index():
     """Main dashboard page"""
-    return render_template('index.html')
+    return render_cached_page('index.html')
 
 @app.route('/api/incidents')
+@cached_json_response(query=parse_q)
 def get_incidents():
     """API endpoint to get recent incidents for dashboard"""
     try:
-        hours = request.args.get('hours', 24, type=int)
-        min_relevance = request.args.get('min_relevance', 0.3, type=float)
-        
-        incidents = notification_agent.get_recent_incidents(hours=hours, min_relevance=min_relevance)
+        q = parse_q()
         
-        incidents_data = []
-        for incident in incidents:
-            incidents_data.append(incident.to_dict())
+        incidents_data = notification_agent.get_recent_incidents_data(hours=q.hours, min_relevance=q.min_relevance)
         
         return jsonify({
             'success': True,
@@ -32,7 +180,7 @@ def get_incidents():
         })
         
     except Exception as e:
-        logging.error(f"Error fetching incidents: {e}")
+        logging.error("Error fetching incidents: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to fetch incidents',
@@ -44,38 +192,50 @@ def get_incidents():
 def get_incident_details(incident_id):
     """Get detailed information about a specific incident"""
     try:
-        incident = Incident.query.get_or_404(incident_id)
+        # Project only the API columns; a single SELECT however many relationships Incident grows
+        row = read_session.execute(
+            select(*INCIDENT_API_COLUMNS).where(Incident.id == incident_id)
+        ).first()
+        
+        if row is None:
+            return jsonify({
+                'success': False,
+                'error': 'Incident not found'
+            }), 404
+        
         return jsonify({
             'success': True,
-            'incident': incident.to_dict()
+            'incident': incident_row_to_dict(row)
         })
         
     except Exception as e:
-        logging.error(f"Error fetching incident {incident_id}: {e}")
+        logging.error("Error fetching incident %s: %s", incident_id, e)
         return jsonify({
             'success': False,
             'error': 'Incident not found'
         }), 404
 
 @app.route('/api/incidents/by-severity/<severity>')
+@cached_json_response()
 def get_incidents_by_severity(severity):
     """Get incidents filtered by severity level"""
     try:
-        valid_severities = ['low', 'medium', 'high', 'critical']
-        if severity not in valid_severities:
+        if severity not in VALID_SEVERITIES:
             return jsonify({
                 'success': False,
                 'error': 'Invalid severity level'
             }), 400
         
-        incidents = Incident.query.filter_by(
-            severity=severity,
-            is_verified=True
-        ).order_by(
-            Incident.created_at.desc()
-        ).limit(10).all()
+        rows = read_session.execute(
+            select(*INCIDENT_API_COLUMNS).where(
+                Incident.severity == severity,
+                Incident.is_verified == True
+            ).order_by(
+                Incident.created_at.desc()
+            ).limit(10)
+        ).all()
         
-        incidents_data = [incident.to_dict() for incident in incidents]
+        incidents_data = [incident_row_to_dict(row) for row in rows]
         
         return jsonify({
             'success': True,
@@ -85,7 +245,7 @@ def get_incidents_by_severity(severity):
         })
         
     except Exception as e:
-        logging.error(f"Error fetching incidents by severity {severity}: {e}")
+        logging.error("Error fetching incidents by severity %s: %s", severity, e)
         return jsonify({
             'success': False,
             'error': 'Failed to fetch incidents'
@@ -94,49 +254,42 @@ def get_incidents_by_severity(severity):
 @app.route('/weather')
 def weather():
     """Weather alerts page"""
-    return render_template('weather.html')
+    return render_cached_page('weather.html')
 
 @app.route('/news')
 def news():
     """News alerts page"""
-    return render_template('news.html')
+    return render_cached_page('news.html')
 
 @app.route('/map')
 def map():
     """Interactive map page"""
-    return render_template('map.html')
+    return render_cached_page('map.html')
 
 @app.route('/api/incidents/weather')
 def get_weather_incidents():
     """API endpoint to get weather-specific incidents"""
     try:
-        hours = request.args.get('hours', 24, type=int)
-        min_relevance = request.args.get('min_relevance', 0.3, type=float)
+        q = parse_q()
+        cutoff_time = _utcnow() - timedelta(hours=q.hours)
         
-        from datetime import datetime, timedelta
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+        rows = db.session.execute(
+            select(*INCIDENT_API_COLUMNS).where(
+                Incident.created_at >= cutoff_time,
+                Incident.source == 'weather',
+                Incident.relevance_score >= q.min_relevance,
+                Incident.is_verified == True
+            ).order_by(
+                Incident.relevance_score.desc(),
+                Incident.created_at.desc()
+            ),
+            execution_options={'yield_per': STREAM_BATCH_SIZE}
+        )
         
-        incidents = Incident.query.filter(
-            Incident.created_at >= cutoff_time,
-            Incident.source == 'weather',
-            Incident.relevance_score >= min_relevance,
-            Incident.is_verified == True
-        ).order_by(
-            Incident.relevance_score.desc(),
-            Incident.created_at.desc()
-        ).all()
-        
-        incidents_data = [incident.to_dict() for incident in incidents]
-        
-        return jsonify({
-            'success': True,
-            'incidents': incidents_data,
-            'count': len(incidents_data),
-            'source': 'weather'
-        })
+        return stream_incidents_response(rows, source='weather')
         
     except Exception as e:
-        logging.error(f"Error fetching weather incidents: {e}")
+        logging.error("Error fetching weather incidents: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to fetch weather incidents',
@@ -148,33 +301,26 @@ def get_weather_incidents():
 def get_news_incidents():
     """API endpoint to get news-specific incidents"""
     try:
-        hours = request.args.get('hours', 24, type=int)
-        min_relevance = request.args.get('min_relevance', 0.3, type=float)
+        q = parse_q()
+        cutoff_time = _utcnow() - timedelta(hours=q.hours)
         
-        from datetime import datetime, timedelta
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+        rows = db.session.execute(
+            select(*INCIDENT_API_COLUMNS).where(
+                Incident.created_at >= cutoff_time,
+                Incident.source == 'news',
+                Incident.relevance_score >= q.min_relevance,
+                Incident.is_verified == True
+            ).order_by(
+                Incident.relevance_score.desc(),
+                Incident.created_at.desc()
+            ),
+            execution_options={'yield_per': STREAM_BATCH_SIZE}
+        )
         
-        incidents = Incident.query.filter(
-            Incident.created_at >= cutoff_time,
-            Incident.source == 'news',
-            Incident.relevance_score >= min_relevance,
-            Incident.is_verified == True
-        ).order_by(
-            Incident.relevance_score.desc(),
-            Incident.created_at.desc()
-        ).all()
-        
-        incidents_data = [incident.to_dict() for incident in incidents]
-        
-        return jsonify({
-            'success': True,
-            'incidents': incidents_data,
-            'count': len(incidents_data),
-            'source': 'news'
-        })
+        return stream_incidents_response(rows, source='news')
         
     except Exception as e:
-        logging.error(f"Error fetching news incidents: {e}")
+        logging.error("Error fetching news incidents: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to fetch news incidents',
@@ -187,81 +333,53 @@ def subscribe():
     """Handle user subscription for email notifications"""
     if request.method == 'POST':
         try:
-            email = request.form.get('email', '').strip()
-            location = request.form.get('location', '').strip()
-            username = request.form.get('username', '').strip()
-            
-            if not email or not location or not username:
-                flash('Please fill in all required fields.', 'error')
+            try:
+                form = SubscribeForm.model_validate(request.form.to_dict())
+            except ValidationError as e:
+                flash(subscribe_form_error(e), 'error')
                 return redirect(url_for('subscribe'))
             
-            # Check if user already exists
-            existing_user = User.query.filter_by(email=email).first()
-            if existing_user:
+            # Create new user subscription; an existing email makes this a no-op
+            upsert = UPSERT_INSERTS[db.engine.dialect.name]
+            new_user_id = db.session.execute(
+                upsert(User).values(
+                    **form.model_dump(),
+                    email_notifications=True
+                ).on_conflict_do_nothing(index_elements=['email']).returning(User.id)
+            ).scalar()
+            db.session.commit()
+            
+            if new_user_id is None:
                 flash('Email already subscribed to notifications.', 'info')
                 return redirect(url_for('index'))
             
-            # Create new user subscription
-            user = User(
-                username=username,
-                email=email,
-                location=location,
-                email_notifications=True
-            )
-            
-            db.session.add(user)
-            db.session.commit()
-            
             flash('Successfully subscribed to CityGuard AI notifications!', 'success')
             return redirect(url_for('index'))
             
         except Exception as e:
-            logging.error(f"Error creating subscription: {e}")
+            logging.error("Error creating subscription: %s", e)
             db.session.rollback()
             flash('Error creating subscription. Please try again.', 'error')
             return redirect(url_for('subscribe'))
     
-    return render_template('subscribe.html')
+    return render_cached_page('subscribe.html')
 
 @app.route('/api/stats')
+@cached_json_response()
 def get_stats():
     """Get dashboard statistics"""
     try:
-        from datetime import datetime, timedelta
-        
         # Get counts for the last 24 hours
-        last_24h = datetime.utcnow() - timedelta(hours=24)
-        
-        total_incidents = Incident.query.filter(
-            Incident.created_at >= last_24h,
-            Incident.is_verified == True
-        ).count()
-        
-        critical_incidents = Incident.query.filter(
-            Incident.created_at >= last_24h,
-            Incident.severity == 'critical',
-            Incident.is_verified == True
-        ).count()
-        
-        high_incidents = Incident.query.filter(
-            Incident.created_at >= last_24h,
-            Incident.severity == 'high',
-            Incident.is_verified == True
-        ).count()
-        
-        weather_incidents = Incident.query.filter(
-            Incident.created_at >= last_24h,
-            Incident.source == 'weather',
-            Incident.is_verified == True
-        ).count()
+        now = _utcnow()
+        last_24h = now - _ONE_DAY
         
-        news_incidents = Incident.query.filter(
-            Incident.created_at >= last_24h,
-            Incident.source == 'news',
-            Incident.is_verified == True
-        ).count()
+        total_incidents, critical_incidents, high_incidents, weather_incidents, news_incidents = (
+            stats_agent.get_incident_counts(last_24h)
+        )
         
-        active_users = User.query.filter_by(email_notifications=True).count()
+        active_users = read_session.scalar(
+            select(func.count(User.id)).where(User.email_notifications == True)
+        )
         
         return jsonify({
             'success': True,
@@ -272,12 +390,12 @@ def get_stats():
                 'weather_incidents_24h': weather_incidents,
                 'news_incidents_24h': news_incidents,
                 'active_subscribers': active_users,
-                'last_updated': datetime.utcnow().isoformat()
+                'last_updated': now.isoformat()
             }
         })
         
     except Exception as e:
-        logging.error(f"Error fetching stats: {e}")
+        logging.error("Error fetching stats: %s", e)
         return jsonify({
             'success': False,
             'error': 'Failed to fetch statistics'
@@ -289,5 +407,5 @@ def page_not_found(e):
 
 @app.errorhandler(500)
 def internal_server_error(e):
-    logging.error(f"Internal server error: {e}")
+    logging.error("Internal server error: %s", e)
     return render_template('500.html'), 500
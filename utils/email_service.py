@@ -36,11 +36,11 @@ class EmailService:
                 server.login(self.email_user, self.email_password)
                 server.send_message(msg)
             
-            logging.info(f"Email alert sent to {user.email} for incident {incident.id}")
+            logging.info("Email alert sent to %s for incident %s", user.email, incident.id)
             return True
             
         except Exception as e:
-            logging.error(f"Failed to send email alert to {user.email}: {e}")
+            logging.error("Failed to send email alert to %s: %s", user.email, e)
             return False
     
     def create_alert_email_body(self, user, incident):
@@ -138,5 +138,5 @@ class EmailService:
             return True
             
         except Exception as e:
-            logging.error(f"Failed to send test email: {e}")
+            logging.error("Failed to send test email: %s", e)
             return False